@@ -1,18 +1,45 @@
 import os
 import sys
+import traceback
+import json
+import functools
+import importlib.util
+import atexit
 import time
 import logging
 import threading
+import queue
 import random
+from collections import deque
 import numpy as np
 import cv2
-import cvzone
+import torch
+import torch.nn.functional as F
 from flask import Flask, Response, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 from ultralytics import YOLO
 from dotenv import load_dotenv
 
+# Optional: NVDEC hardware decoding (GPU hosts only)
+try:
+    from torchcodec.decoders import VideoDecoder
+except ImportError:
+    VideoDecoder = None
+
+# Optional: PyAV for multi-threaded FFmpeg decoding on the CPU
+try:
+    import av
+except ImportError:
+    av = None
+
+# Optional: libjpeg-turbo SIMD encoder for MJPEG frames (falls back to cv2.imencode)
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _tj = TurboJPEG()
+except Exception:
+    _tj = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -34,11 +61,29 @@ socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading')
 # --- Configuration (env-driven) ---
 base_dir = os.path.dirname(os.path.abspath(__file__))
 model_path  = os.path.join(base_dir, os.getenv('MODEL_PATH',   'final_model.pt'))
+# INT8 OpenVINO export of final_model.pt for CPU hosts, produced once (at INFER_IMGSZ, so
+# INT8 calibration sees the resolution that is served) with:
+#   yolo export model=final_model.pt format=openvino int8=True data=calib.yaml imgsz=320 batch=2 dynamic=True
+int8_model_path = os.path.join(base_dir, os.getenv('INT8_MODEL_PATH', 'final_model_int8_openvino_model'))
+# TensorRT engine for NVIDIA hosts, produced once (on the target GPU) with:
+#   yolo export model=final_model.pt format=engine half=True int8=True data=calib.yaml imgsz=320 batch=2 dynamic=True
+engine_model_path = os.path.join(base_dir, os.getenv('ENGINE_MODEL_PATH', 'final_model.engine'))
 video_path_1 = os.path.join(base_dir, os.getenv('VIDEO_PATH_1', 'Parking_Lot_CCTV_1.mp4'))
 video_path_2 = os.path.join(base_dir, os.getenv('VIDEO_PATH_2', 'Parking_Lot_CCTV_2.1.mp4'))
 
 classNames = ['occupied_slot', 'free_slot']
 
+# Inference resolution: YOLO letterboxes CPU-decoded frames to this size itself;
+# NVDEC tensors skip that step, so _letterbox_tensor does the same on the GPU.
+infer_imgsz = int(os.getenv('INFER_IMGSZ', 320))
+# Every MJPEG frame is annotated and encoded at this (w, h), whatever the decoder
+DISPLAY_SIZE = (640, 480)
+jpeg_quality = int(os.getenv('JPEG_QUALITY', 70))
+# Mean 80x60 grayscale abs-diff below which a frame counts as unchanged (0 disables)
+motion_threshold = float(os.getenv('MOTION_THRESHOLD', 2.0))
+# Cap on annotated frames per second per feed (decoding still follows the video's own FPS)
+stream_fps = max(1.0, float(os.getenv('STREAM_FPS', 10)))  # <= 0 would divide by zero in _Pacer
+
 # --- In-memory stats (protected by a lock, updated by background sampler) ---
 _stats_lock = threading.Lock()
 _slot_stats = {
@@ -53,70 +98,269 @@ _system_metrics = {
     "violations":      3,
 }
 
+# Snapshot + JSON of _slot_stats, rebuilt once per update and shared by the REST
+# route, the broadcasts and every new connection instead of re-copying each time.
+_slot_stats_snapshot = dict(_slot_stats)
+_slot_stats_json     = json.dumps(_slot_stats, separators=(',', ':'))
+
+
+# Who is watching the stats: live SocketIO connections, and when REST last polled
+_socket_clients  = 0
+_last_stats_poll = 0.0
+STATS_POLL_IDLE  = 30  # seconds without a REST poll before the sampler idles
+
+
+def _stats_wanted() -> bool:
+    """True while any SocketIO client is connected or the REST stats were polled recently."""
+    return _socket_clients > 0 or time.monotonic() - _last_stats_poll < STATS_POLL_IDLE
+
+
+def _refresh_stats_cache():
+    """Rebuild the cached snapshot/JSON of _slot_stats; call with _stats_lock held."""
+    global _slot_stats_snapshot, _slot_stats_json
+    _slot_stats_snapshot = dict(_slot_stats)
+    _slot_stats_json     = json.dumps(_slot_stats, separators=(',', ':'))
+
+
 # --- Load Model Once (shared across all threads) ---
+_device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+
+def _optimize_pytorch(m):
+    """Tune raw PyTorch weights: fuse Conv+BN, then switch to channels_last layout."""
+    torch.set_float32_matmul_precision('medium')
+    # Fuse first: fuse_conv_and_bn .view()s conv weights, which fails once they are
+    # channels_last. AutoBackend then sees an already-fused model and keeps this one.
+    m.model = m.model.fuse(verbose=False).to(memory_format=torch.channels_last).eval()
+    return m
+
+
+def _load_model():
+    """Pick the fastest detector for this host.
+
+    GPU: the TensorRT engine if present, else the PyTorch weights on CUDA.
+    CPU: the INT8 OpenVINO export if it and openvino are present, else the PyTorch weights.
+    """
+    if _device != 'cpu':
+        if os.path.exists(engine_model_path):
+            m = YOLO(engine_model_path, task='detect')
+            print("✅ TensorRT Engine Loaded into Memory.")
+            return m
+        m = _optimize_pytorch(YOLO(model_path).to(_device))
+        print("✅ Model Loaded into GPU Memory.")
+        return m
+    if os.path.exists(int8_model_path) and importlib.util.find_spec('openvino') is not None:
+        m = YOLO(int8_model_path, task='detect')
+        print("✅ INT8 OpenVINO Model Loaded into Memory.")
+        return m
+    m = _optimize_pytorch(YOLO(model_path).to('cpu'))
+    print("✅ Model Loaded into Memory.")
+    return m
+
+
 print("\n--- Loading Shared YOLO Model ---")
 model = None
 try:
-    model = YOLO(model_path)
-    model.to('cpu')
-    print("✅ Model Loaded into Memory.")
+    model = _load_model()
 except Exception as e:
     print(f"⚠️  Model not loaded (will use mock data): {e}")
 
+# Leave cores for the request/encode threads and keep OpenCV from spawning its
+# own pool on top of Torch's — otherwise the two oversubscribe the CPU.
+torch.set_num_threads(int(os.getenv('TORCH_THREADS', max(1, (os.cpu_count() or 2) // 2))))
+cv2.setNumThreads(1)
+
+
+class InferenceHub:
+    """Funnel every detector call through one thread, batching concurrent frames.
+
+    Camera workers and the stats sampler submit frames and block until their
+    result is ready. Each tick the hub drains up to ``max_batch`` pending
+    frames (waiting at most ``window`` seconds for stragglers) and runs them
+    through a single YOLO forward pass, so preprocess/NMS/Python overhead is
+    paid once per batch rather than once per feed.
+
+    The hub thread is also the only one that touches the model: it warms the
+    Ultralytics predictor up once and then calls it directly, so preprocess
+    and NMS buffers (and any CUDA/TensorRT context) are reused across calls.
+    """
+
+    def __init__(self, max_batch: int = 2, window: float = 0.033):
+        self.max_batch = max_batch
+        self.window    = window
+        self._pending  = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, frame):
+        """Queue one frame and wait for its Ultralytics results."""
+        job = {'frame': frame, 'done': threading.Event(), 'results': None, 'error': None}
+        self._pending.put(job)
+        job['done'].wait()
+        if job['error'] is not None:
+            raise job['error']
+        return job['results']
+
+    def _run(self):
+        if model is not None:
+            self._warm_up()
+        while True:
+            jobs = [self._pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(jobs) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(self._pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            # CUDA tensors (NVDEC) and numpy arrays cannot share one batch
+            tensors = [j for j in jobs if torch.is_tensor(j['frame'])]
+            arrays  = [j for j in jobs if not torch.is_tensor(j['frame'])]
+            for group in (arrays, tensors):
+                if group:
+                    self._forward(group)
+
+    def _warm_up(self):
+        """Build the predictor with the serving args by running one blank frame."""
+        blank = np.zeros((480, 640, 3), dtype=np.uint8)
+        try:
+            with torch.inference_mode():
+                model(blank, imgsz=infer_imgsz, verbose=False, conf=0.4, device=_device)
+
+            # Compile the network the predictor actually runs (AutoBackend's fuse() would
+            # unwrap a compiled Model.model), then run the blank frame again so the
+            # compilation cost lands here rather than on the first client frame.
+            backend = model.predictor.model
+            if os.getenv('TORCH_COMPILE', '0') == '1' and getattr(backend, 'pt', False):
+                backend.model = torch.compile(backend.model, mode='reduce-overhead')
+                with torch.inference_mode():
+                    model.predictor(blank)
+            print("✅ Inference Predictor Warmed Up.")
+        except Exception as exc:
+            # Not fatal (batches fall back to model(...)), but the optimised path is off
+            print(f"❌ Inference predictor warm-up FAILED, serving without it: {exc}")
+            traceback.print_exc()
 
+    def _forward(self, jobs):
+        frames = [j['frame'] for j in jobs]
+        try:
+            # Inside the try: a bad stack must reach the waiters, not kill the hub thread
+            batch = torch.stack(frames) if torch.is_tensor(frames[0]) else frames
+            with torch.inference_mode():
+                if model.predictor is not None and model.predictor.model is not None:
+                    # Skip Model.predict's per-call arg merging; args were fixed at warm-up
+                    results = model.predictor(batch)
+                else:
+                    results = model(batch, imgsz=infer_imgsz, verbose=False, conf=0.4, device=_device)
+            for job, r in zip(jobs, results):
+                job['results'] = [r]
+        except Exception as exc:
+            for job in jobs:
+                job['error'] = exc
+        for job in jobs:
+            job['done'].set()
+
+
+_hub = InferenceHub(max_batch=int(os.getenv('INFER_BATCH', 2)))
+
+
+def infer(frame):
+    """Run the shared detector on one frame (BGR array or CUDA RGB tensor) and return its results."""
+    return _hub.submit(frame)
+
+
+_OCCUPIED_CLS = classNames.index('occupied_slot')
+_FREE_CLS     = classNames.index('free_slot')
+
+
+def _box_arrays(results):
+    """Return (cls, xyxy) int32 arrays for all boxes, copying each tensor off-device once."""
+    if not results:
+        return np.empty(0, dtype=np.int32), np.empty((0, 4), dtype=np.int32)
+    cls  = np.concatenate([r.boxes.cls.int().cpu().numpy() for r in results])
+    xyxy = np.concatenate([r.boxes.xyxy.int().cpu().numpy() for r in results])
+    return cls, xyxy
 
 
 # ---------------------------------------------------------------------------
 # Background Stats Sampler
 # ---------------------------------------------------------------------------
 
+# Captures stay open between ticks so FFmpeg context/seek-table setup happens once
+SAMPLE_INTERVAL = 10  # seconds between stats samples
+_sampler_lock = threading.Lock()
+_sampler_caps = {}  # path -> VideoCapture
+
+
+def _sampler_capture(path: str):
+    """Return the persistent capture for a path, opening it on first use."""
+    if path not in _sampler_caps:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        _sampler_caps[path] = cap
+    return _sampler_caps[path]
+
+
+@atexit.register
+def _release_sampler_caps():
+    with _sampler_lock:
+        for cap in _sampler_caps.values():
+            cap.release()
+        _sampler_caps.clear()
+
+
 def _sample_one_frame(path: str):
-    """Open a video, jump to a random frame, run inference, return (occupied, free)."""
+    """Read the frame SAMPLE_INTERVAL on from the last sample, run inference, return (occupied, free).
+
+    The capture stays open and steps forward one interval's worth of frames with
+    grab(), which demuxes and decodes but skips the BGR conversion. That keeps
+    the sample in step with the clip's own clock without a random H.264 seek,
+    which would decode forward from the previous keyframe on every tick.
+    """
     if not _is_valid_video(path):
         return None
-    cap = cv2.VideoCapture(path)
-    if not cap.isOpened():
-        return None
 
-    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    if total > 1:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, random.randint(0, total - 1))
+    with _sampler_lock:
+        cap = _sampler_capture(path)
+        if cap is None:
+            return None
+        for _ in range(max(0, round(_video_fps(path) * SAMPLE_INTERVAL) - 1)):
+            if not cap.grab():  # wrap around at the end of the clip
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                break
+        success, frame = cap.read()
+        if not success:  # wrap around at the end of the clip
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = cap.read()
 
-    success, frame = cap.read()
-    cap.release()
     if not success:
         return None
 
-    frame = cv2.resize(frame, (640, 480))
-
     if model is None:
         return None
 
-    results = model(frame, stream=False, verbose=False, conf=0.4)
-
-    occupied = free = 0
-    for r in results:
-        for box in r.boxes:
-            cls = int(box.cls[0])
-            if cls < len(classNames):
-                if classNames[cls] == 'occupied_slot':
-                    occupied += 1
-                else:
-                    free += 1
+    cls, _ = _box_arrays(infer(frame))
+    occupied = int(np.sum(cls == _OCCUPIED_CLS))
+    free     = int(np.sum(cls == _FREE_CLS))
     return occupied, free
 
 
 def background_stats_updater():
-    """Daemon thread: sample a frame every 10 s and update in-memory counters."""
+    """Daemon thread: sample a frame every SAMPLE_INTERVAL s and update in-memory counters."""
     while True:
         try:
-            result = _sample_one_frame(video_path_1)
+            result = _sample_one_frame(video_path_1) if _stats_wanted() else None
             if result:
                 occupied, free = result
                 total = occupied + free
                 if total > 0:
                     rate = round((occupied / total) * 100, 1)
                     with _stats_lock:
+                        previous = _slot_stats_json
                         _slot_stats['occupiedSlots'] = occupied
                         _slot_stats['freeSlots']     = free
                         _slot_stats['totalSlots']    = total
@@ -124,14 +368,17 @@ def background_stats_updater():
                         _system_metrics['activeVehicles'] = occupied
                         _system_metrics['dailyRevenue']   = round(occupied * 150 * 0.8)
                         _system_metrics['violations']     = random.randint(0, 5)
+                        _refresh_stats_cache()
+                        changed  = _slot_stats_json != previous
+                        snapshot = _slot_stats_snapshot
 
-                    # Push to all connected WebSocket clients
-                    socketio.emit('slot_updates', dict(_slot_stats))
-                    socketio.emit('stats-update', dict(_slot_stats))
+                    # Push to all connected WebSocket clients, only when the counts moved
+                    if changed:
+                        socketio.emit('stats-update', snapshot)
         except Exception as exc:
             print(f"[Stats Sampler] Error: {exc}")
 
-        time.sleep(10)
+        time.sleep(SAMPLE_INTERVAL)
 
 
 # ---------------------------------------------------------------------------
@@ -152,8 +399,22 @@ def _make_placeholder_frame(message: str = 'Signal Lost') -> bytes:
     return buf.tobytes()
 
 
+def _mjpeg_part(jpeg: bytes) -> bytes:
+    """Wrap JPEG bytes in the multipart/x-mixed-replace envelope for one frame."""
+    return b''.join((b'--frame\r\nContent-Type: image/jpeg\r\n\r\n', jpeg, b'\r\n'))
+
+
+# Rendered once at import and shared by every feed that has no playable video
+_PLACEHOLDER_BYTES = _mjpeg_part(_make_placeholder_frame('Signal Lost – Video Unavailable'))
+
+
+@functools.lru_cache(maxsize=8)
 def _is_valid_video(path: str) -> bool:
-    """Return True only if the file is a real, openable video (not an LFS pointer)."""
+    """Return True only if the file is a real, openable video (not an LFS pointer).
+
+    Cached for the life of the process so the sampler tick and each new client
+    don't re-probe the file through FFmpeg.
+    """
     if not os.path.exists(path):
         return False
     if os.path.getsize(path) < 10_000:  # LFS pointer files are ~134 bytes
@@ -164,52 +425,346 @@ def _is_valid_video(path: str) -> bool:
     return ok
 
 
-def stream_logic(path: str):
-    """Yield MJPEG frames with YOLO overlays for the given video path."""
-    # If the file is an LFS pointer or missing, stream a placeholder
-    if not _is_valid_video(path):
-        print(f"[Stream] '{os.path.basename(path)}' is not a valid video "
-              "(LFS pointer or missing). Streaming placeholder.")
-        placeholder = _make_placeholder_frame('Signal Lost – Video Unavailable')
-        frame_bytes = (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
-                       + placeholder + b'\r\n')
-        while True:
-            yield frame_bytes
-            time.sleep(0.5)   # ~2 fps placeholder
-        return
+@functools.lru_cache(maxsize=8)
+def _video_fps(path: str) -> float:
+    """Return the container's frame rate, defaulting to 25 when it is not reported."""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps > 0 else 25.0
+
+
+class _Pacer:
+    """Monotonic-clock rate limiter: ``wait()`` sleeps until the next tick is due."""
 
+    def __init__(self, fps: float):
+        self.dt     = 1.0 / fps
+        self.t_next = time.monotonic()
+
+    def wait(self):
+        self.t_next += self.dt
+        delay = self.t_next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.t_next = time.monotonic()  # running late: don't burst to catch up
+
+
+# Decode straight into GPU memory when NVDEC is available, so frames never
+# cross PCIe before inference; otherwise decode on the CPU with PyAV or OpenCV.
+_use_nvdec = VideoDecoder is not None and _device != 'cpu'
+
+
+def _frames_opencv(path: str):
+    """Yield source-resolution BGR frames from a CPU-decoded video, looping forever."""
     cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            success, img = cap.read()
 
-    while True:
-        success, img = cap.read()
+            # Loop the video when it ends
+            if not success:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
 
-        # Loop the video when it ends
-        if not success:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
+            yield img
+    finally:
+        cap.release()
 
-        # Resize for faster inference
-        img = cv2.resize(img, (640, 480))
 
-        if model is not None:
-            results = model(img, stream=True, verbose=False, conf=0.4)
-            for r in results:
-                for box in r.boxes:
-                    cls   = int(box.cls[0])
-                    label = classNames[cls] if cls < len(classNames) else "Unknown"
-                    color = (0, 255, 0) if label == 'free_slot' else (0, 0, 255)
+def _frames_pyav(path: str):
+    """Yield source-resolution BGR frames via PyAV with FFmpeg frame threading, looping forever."""
+    container = av.open(path)
+    stream = container.streams.video[0]
+    stream.thread_type = 'AUTO'
+    try:
+        while True:
+            for frame in container.decode(stream):
+                yield frame.to_ndarray(format='bgr24')
+
+            # Loop the video when it ends (seek also flushes the decoder)
+            container.seek(0)
+    finally:
+        container.close()
+
+
+@functools.lru_cache(maxsize=8)
+def _nvdec_ok(path: str) -> bool:
+    """Return True if NVDEC can open and decode the first frame of this video.
+
+    Cached per path: a codec or profile the hardware decoder rejects fails the
+    same way every time, so the CPU decoders take over for good.
+    """
+    try:
+        dec = VideoDecoder(path, device=_device)
+        dec[0]
+        del dec
+        return True
+    except Exception as exc:
+        print(f"[Stream] NVDEC cannot decode '{os.path.basename(path)}', using the CPU decoder: {exc}")
+        return False
+
 
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    w, h = x2 - x1, y2 - y1
-                    cvzone.cornerRect(img, (x1, y1, w, h), t=2, rt=0,
-                                      colorC=color, colorR=color)
+def _frames_nvdec(path: str):
+    """Yield 640x480 RGB float CUDA tensors from an NVDEC-decoded video, looping forever."""
+    dec = VideoDecoder(path, device=_device)
+    try:
+        while True:
+            for frame in dec:
+                # Decode straight to the display size; _letterbox_tensor sizes the inference copy
+                frame = F.interpolate(frame[None].float(), size=(480, 640),
+                                      mode='bilinear', align_corners=False)
+                yield frame[0] / 255
+    finally:
+        # VideoDecoder has no close(); dropping it frees the NVDEC session
+        del dec
+
+
+def _open_frames(path: str, cpu_only: bool = False):
+    """Return the looping frame generator for a path: NVDEC, else PyAV, else OpenCV."""
+    if _use_nvdec and not cpu_only and _nvdec_ok(path):
+        return _frames_nvdec(path)
+    if av is not None:
+        return _frames_pyav(path)
+    return _frames_opencv(path)
+
+
+def _to_host_bgr(frame) -> np.ndarray:
+    """Return a BGR uint8 image for drawing/encoding, copying CUDA frames to host."""
+    if isinstance(frame, np.ndarray):
+        return frame
+    return (frame.flip(0).permute(1, 2, 0) * 255).byte().contiguous().cpu().numpy()
+
+
+def _display_copy(frame):
+    """Return the DISPLAY_SIZE BGR image to annotate and the (sx, sy) scale from frame to it."""
+    img = _to_host_bgr(frame)
+    h, w = img.shape[:2]
+    dw, dh = DISPLAY_SIZE
+    if (w, h) == (dw, dh):
+        return img, (1.0, 1.0)
+    return cv2.resize(img, DISPLAY_SIZE, interpolation=cv2.INTER_AREA), (dw / w, dh / h)
+
+
+def _letterbox_tensor(frame):
+    """Letterbox a CHW float CUDA frame to infer_imgsz, as YOLO does for arrays.
+
+    Tensors bypass YOLO's own preprocessing, so resize the long side to
+    infer_imgsz and pad right/bottom to a stride-32 multiple. Returns the
+    tensor and the resize ratio, which maps its boxes back onto the frame.
+    """
+    h, w = frame.shape[1:]
+    r = infer_imgsz / max(h, w)
+    nh, nw = round(h * r), round(w * r)
+    img = F.interpolate(frame[None], size=(nh, nw), mode='bilinear', align_corners=False)[0]
+    return F.pad(img, (0, -nw % 32, 0, -nh % 32), value=114 / 255), r
+
+
+def _encode_jpeg(img: np.ndarray):
+    """JPEG-encode a BGR image with libjpeg-turbo when available; None on failure."""
+    if _tj is not None:
+        return _tj.encode(img, quality=jpeg_quality, pixel_format=TJPF_BGR)
+    ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return buffer.tobytes() if ret else None
+
+
+def _draw_corners(img: np.ndarray, boxes: np.ndarray, color, length: int = 30):
+    """Draw corner brackets for (N, 4) xyxy boxes with a single cv2.polylines call."""
+    if not len(boxes):
+        return
+    x1, y1, x2, y2 = boxes.T
+    corners = np.stack([
+        np.stack([x1 + length, y1, x1, y1, x1, y1 + length], axis=1),  # top-left
+        np.stack([x2 - length, y1, x2, y1, x2, y1 + length], axis=1),  # top-right
+        np.stack([x1 + length, y2, x1, y2, x1, y2 - length], axis=1),  # bottom-left
+        np.stack([x2 - length, y2, x2, y2, x2, y2 - length], axis=1),  # bottom-right
+    ], axis=1).reshape(-1, 3, 2).astype(np.int32)
+    cv2.polylines(img, corners, False, color, 2)
+
+
+def _annotate(frame, img: np.ndarray, scale):
+    """Run inference on a frame, draw slot boxes on its display copy and return the JPEG bytes (or None)."""
+    if torch.is_tensor(frame):
+        frame, r = _letterbox_tensor(frame)
+        scale = (scale[0] / r, scale[1] / r)
+    results = infer(frame) if model is not None else []
+
+    cls, xyxy = _box_arrays(results)
+    sx, sy = scale
+    if (sx, sy) != (1.0, 1.0):
+        xyxy = (xyxy * np.array([sx, sy, sx, sy])).astype(np.int32)
+    is_free = cls == _FREE_CLS
+    _draw_corners(img, xyxy[is_free], (0, 255, 0))
+    _draw_corners(img, xyxy[~is_free], (0, 0, 255))  # occupied (and unknown) slots
+
+    return _encode_jpeg(img)
+
+
+class StreamWorker:
+    """Capture → inference/encode pipeline for one video, shared by all its clients.
+
+    A reader thread decodes frames into ``raw_q`` while an inference thread
+    annotates and encodes them into ``out_q``, so decode I/O overlaps with
+    YOLO instead of running serially per frame. Both queues hold at most two
+    items; the oldest is dropped when a stage falls behind. ``out_q`` holds
+    complete MJPEG parts, so every client yields the same bytes object.
+
+    A decoder that raises is reopened on the CPU; if that keeps failing the
+    worker is marked ``dead``, its clients are released and _get_worker
+    starts a fresh one for the next client.
+    """
+
+    MAX_DECODE_FAILURES = 3
+
+    def __init__(self, path: str):
+        self.path   = path
+        self.raw_q  = deque(maxlen=2)
+        self.out_q  = deque(maxlen=2)
+        self._raw_cv = threading.Condition()
+        self._out_cv = threading.Condition()
+        self._seq = 0  # bumped for every encoded frame pushed to out_q
+        self.dead = False
+
+        # Connected MJPEG clients; both threads park on _active while it is zero
+        self._clients = 0
+        self._active  = threading.Condition()
+
+        # Motion gate: thumbnail of the last frame YOLO actually saw, and its output
+        self._ref_small = None
+        self._last_part = None
+
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._infer_loop, daemon=True).start()
+
+    def _read_loop(self):
+        # Decode in real time; a file read flat out would only be dropped from raw_q
+        pacer    = _Pacer(_video_fps(self.path))
+        cpu_only = False
+        failures = 0
+        while failures < self.MAX_DECODE_FAILURES:
+            try:
+                for frame in _open_frames(self.path, cpu_only):
+                    failures = 0
+                    with self._raw_cv:
+                        self.raw_q.append(frame)
+                        self._raw_cv.notify()
+                    pacer.wait()
+                    self._wait_for_clients()
+            except Exception as exc:
+                failures += 1
+                cpu_only = True
+                print(f"[Stream] Decoder error on '{os.path.basename(self.path)}' "
+                      f"({failures}/{self.MAX_DECODE_FAILURES}), reopening on the CPU: {exc}")
+                time.sleep(1)
+        self._die()
+
+    def _die(self):
+        """Mark the worker dead and wake every thread and client parked on it."""
+        print(f"[Stream] Giving up on '{os.path.basename(self.path)}'.")
+        self.dead = True
+        for cv in (self._raw_cv, self._out_cv, self._active):
+            with cv:
+                cv.notify_all()
+
+    def _render(self, frame):
+        """Return the MJPEG part for a frame, or None if it could not be encoded."""
+        img, scale = _display_copy(frame)
+        small = cv2.cvtColor(cv2.resize(img, (80, 60), interpolation=cv2.INTER_AREA),
+                             cv2.COLOR_BGR2GRAY)
+
+        # Static scene: resend the last annotated frame instead of re-running YOLO.
+        # Compared against the last *inferred* frame so slow drift still triggers.
+        if (self._last_part is not None
+                and cv2.absdiff(small, self._ref_small).mean() < motion_threshold):
+            return self._last_part
+
+        jpeg = _annotate(frame, img, scale)
+        if jpeg is None:
+            return None
+        part = _mjpeg_part(jpeg)
+        self._ref_small = small
+        self._last_part = part
+        return part
+
+    def _infer_loop(self):
+        pacer = _Pacer(stream_fps)
+        while not self.dead:
+            pacer.wait()
+            self._wait_for_clients()
+            with self._raw_cv:
+                while not self.raw_q and not self.dead:
+                    self._raw_cv.wait()
+                if self.dead:
+                    return
+                frame = self.raw_q.popleft()
+
+            try:
+                part = self._render(frame)
+            except Exception as exc:
+                print(f"[Stream] Frame error on '{os.path.basename(self.path)}': {exc}")
+                continue
+            if part is None:
+                continue
+
+            with self._out_cv:
+                self.out_q.append(part)
+                self._seq += 1
+                self._out_cv.notify_all()
+
+    def _wait_for_clients(self):
+        with self._active:
+            while self._clients == 0 and not self.dead:
+                self._active.wait()
+
+    def frames(self):
+        """Yield each new MJPEG part; slow clients skip straight to the latest one.
+
+        Returns once the worker is dead.
+        """
+        with self._active:
+            self._clients += 1
+            self._active.notify_all()
+        try:
+            seen = 0
+            while True:
+                with self._out_cv:
+                    while self._seq == seen and not self.dead:
+                        self._out_cv.wait()
+                    if self.dead:
+                        return
+                    seen = self._seq
+                    part = self.out_q[-1]
+                yield part
+        finally:
+            with self._active:
+                self._clients -= 1
 
-        ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
-        if not ret:
-            continue
 
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def _get_worker(path: str) -> StreamWorker:
+    """Return the StreamWorker for a video path, starting it on first use or after it died."""
+    with _workers_lock:
+        if path not in _workers or _workers[path].dead:
+            _workers[path] = StreamWorker(path)
+        return _workers[path]
+
+
+def stream_logic(path: str):
+    """Yield MJPEG frames with YOLO overlays for the given video path."""
+    # If the file is an LFS pointer or missing, stream a placeholder
+    if not _is_valid_video(path):
+        print(f"[Stream] '{os.path.basename(path)}' is not a valid video "
+              "(LFS pointer or missing). Streaming placeholder.")
+    else:
+        # frames() only returns if the worker's decoder died for good
+        yield from _get_worker(path).frames()
+
+    while True:
+        yield _PLACEHOLDER_BYTES
+        time.sleep(0.5)   # ~2 fps placeholder
 
 
 # ---------------------------------------------------------------------------
@@ -231,13 +786,16 @@ def health():
 @app.route('/slot_stats')
 def slot_stats():
     """Return current slot occupancy counters."""
-    with _stats_lock:
-        return jsonify(dict(_slot_stats))
+    global _last_stats_poll
+    _last_stats_poll = time.monotonic()
+    return Response(_slot_stats_json, mimetype='application/json')
 
 
 @app.route('/system_metrics')
 def system_metrics():
     """Return revenue / vehicle / violation metrics."""
+    global _last_stats_poll
+    _last_stats_poll = time.monotonic()
     with _stats_lock:
         return jsonify(dict(_system_metrics))
 
@@ -262,9 +820,11 @@ def video_feed_2():
 
 @socketio.on('connect')
 def handle_connect():
+    global _socket_clients
     print("[SocketIO] Client connected")
     with _stats_lock:
-        emit('slot_updates', dict(_slot_stats))
+        _socket_clients += 1
+    emit('stats-update', _slot_stats_snapshot)
 
 
 @socketio.on('subscribe')
@@ -274,7 +834,10 @@ def handle_subscribe(channel):
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    global _socket_clients
     print("[SocketIO] Client disconnected")
+    with _stats_lock:
+        _socket_clients -= 1
 
 
 # ---------------------------------------------------------------------------
@@ -291,5 +854,9 @@ if __name__ == "__main__":
     print(f"🔗 Feed 1:         http://localhost:{port}/video_feed_1")
     print(f"🔗 Feed 2:         http://localhost:{port}/video_feed_2")
 
+    # Local development only. In production run a single gthread worker so every
+    # request thread shares the one loaded model (eventlet's green threads would
+    # serialise behind the native inference/decoder threads):
+    #   gunicorn -k gthread --threads 16 -w 1 -b 0.0.0.0:$PORT app:app
     # socketio.run keeps WebSocket support alive
     socketio.run(app, host='0.0.0.0', port=port, debug=False)